@@ -5,44 +5,90 @@
 # src/qsspp/cli.py
 
 import argparse
+import os
 import sys
+from collections import Counter
+from fnmatch import fnmatch
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from typing import Iterator, Sequence
 
-from .core import compile_qss
+from .core import clear_cache, compile_to_file
 
 
 def compile_one(src: Path, dst: Path) -> bool:
     """Compile a single .qsspp -> .qss. Returns True on success."""
     try:
-        css = compile_qss(src)
-        dst.parent.mkdir(parents=True, exist_ok=True)
-        dst.write_text(css, encoding="utf-8")
-        print(f"[OK] {src} -> {dst} ({len(css)} bytes)")
+        compile_to_file(src, dst)
+        print(f"[OK] {src} -> {dst} ({dst.stat().st_size} bytes)")
         return True
     except Exception as e:
         print(f"[ERROR] {src}: {e}", file=sys.stderr)
         return False
 
 
+def _is_qsspp(name: str) -> bool:
+    return name.lower().endswith(".qsspp")
+
+
+def _walk(base: str, parts: Sequence[str]) -> Iterator[str]:
+    """Yield .qsspp files under `base` matching the remaining pattern parts."""
+    part, rest = parts[0], parts[1:]
+    if not any(c in part for c in "*?["):
+        # a literal component after a wildcard (e.g. "assets/*/../x.qsspp"):
+        # joined as is, like Path.glob, so ".." works too
+        path = os.path.join(base, part)
+        if rest:
+            if os.path.isdir(path):
+                yield from _walk(path, rest)
+        elif _is_qsspp(part) and os.path.isfile(path):
+            yield path
+        return
+    try:
+        entries = list(os.scandir(base))
+    except OSError:
+        return
+    if part == "**":
+        # zero directories, then every (non-symlinked) subdirectory
+        if rest:
+            yield from _walk(base, rest)
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                yield from _walk(entry.path, parts)
+        return
+    for entry in entries:
+        if not fnmatch(entry.name, part):
+            continue
+        if rest:
+            if entry.is_dir():
+                yield from _walk(entry.path, rest)
+        elif _is_qsspp(entry.name) and entry.is_file():
+            yield entry.path
+
+
+def _glob_qsspp(pattern: str) -> Iterator[str]:
+    parts = Path(pattern).parts
+    for i, part in enumerate(parts):
+        if any(c in part for c in "*?["):
+            base = os.path.join(*parts[:i]) if i else os.curdir
+            yield from _walk(base, parts[i:])
+            return
+    # no wildcard: a plain file path
+    if _is_qsspp(pattern) and os.path.isfile(pattern):
+        yield pattern
+
+
 def resolve_inputs(patterns: list[str]) -> list[Path]:
     """Resolve glob patterns to .qsspp files."""
     files: list[Path] = []
     for pat in patterns:
         # support recursive globs like assets/**/*.qsspp
-        matches = list(Path().glob(pat))
+        matches = [Path(p) for p in _glob_qsspp(pat)]
         if not matches:
             print(f"[WARN] no files matched: {pat}", file=sys.stderr)
         files.extend(matches)
-    # keep only .qsspp files
-    files = [p for p in files if p.is_file() and p.suffix.lower() == ".qsspp"]
     # de-duplicate while preserving order
-    seen = set()
-    uniq: list[Path] = []
-    for f in files:
-        if f not in seen:
-            uniq.append(f)
-            seen.add(f)
-    return uniq
+    return list(dict.fromkeys(files))
 
 
 def main() -> int:
@@ -64,6 +110,7 @@ def main() -> int:
         ),
     )
     args = parser.parse_args()
+    clear_cache()
 
     sources = resolve_inputs(args.inputs)
     if not sources:
@@ -90,8 +137,27 @@ def main() -> int:
         # multiple inputs
         if out_arg:
             out_arg.mkdir(parents=True, exist_ok=True)
-        for src in sources:
-            dst = (out_arg / (src.stem + ".qss")) if out_arg else src.with_suffix(".qss")
+        dsts = [(out_arg / (src.stem + ".qss")) if out_arg else src.with_suffix(".qss")
+                for src in sources]
+        # inputs sharing a destination (same stem into one --out directory)
+        # are compiled in the main process, in input order, so the last one
+        # wins as in a serial run
+        keys = [dst.resolve() for dst in dsts]
+        counts = Counter(keys)
+        pooled = [(src, dst) for src, dst, key in zip(sources, dsts, keys) if counts[key] == 1]
+        if len(pooled) > 4:
+            serial = [(src, dst) for src, dst, key in zip(sources, dsts, keys) if counts[key] > 1]
+            # each file is independent CPU-bound work: spread it over the cores.
+            # Batches are sized so every worker gets several of them; note each
+            # worker keeps its own parse cache, so a partial shared by many
+            # inputs is read once per worker rather than once per run.
+            workers = min(os.cpu_count() or 1, len(pooled))
+            chunksize = max(1, len(pooled) // (workers * 4))
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                success &= all(executor.map(compile_one, *zip(*pooled), chunksize=chunksize))
+        else:
+            serial = list(zip(sources, dsts))
+        for src, dst in serial:
             success &= compile_one(src, dst)
 
     return 0 if success else 1
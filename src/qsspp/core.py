@@ -6,186 +6,472 @@
 
 from __future__ import annotations
 
+import os
 import re
+import shutil
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, Set
+from typing import Callable, Dict, List, Optional, Set, Tuple, Union, overload
 
-_VAR_DEF_RE = re.compile(r'^\s*\$([A-Za-z_]\w*)\s*:\s*(.+?);\s*$', re.MULTILINE)
 _VAR_USE_RE = re.compile(r'\$([A-Za-z_]\w*)\b')
-_IMPORT_RE = re.compile(r'^\s*@import\s+"([^"]+)"\s*;.*$', re.MULTILINE)
-_FUNC_RE = re.compile(r'\b(darken|lighten|alpha)\(\s*([^,]+)\s*,\s*([^)]+)\)', re.IGNORECASE)
+_CALL_RE = re.compile(r'\b(darken|lighten|alpha)\(|[()]', re.IGNORECASE)
+_COMMENT_RE = re.compile(r'/\*.*?\*/', re.DOTALL)
+_HEX_RE = re.compile(r'#?([0-9A-Fa-f]{3}|[0-9A-Fa-f]{6})$')
+
+# bound once: these run inside the per-value / per-call resolution loops
+_sub_vars = _VAR_USE_RE.sub
+_match_hex = _HEX_RE.match
+
+# "00".."FF", indexed by channel value
+_HEX2 = tuple(f"{i:02X}" for i in range(256))
+
+# Fused tokenizer: one alternation walked once, dispatched on ``lastindex``.
+#   1 comment | 2 import (3 path) | 4 declaration (5 name, 6 value)
+#   7 color function opening | 8 use (9 name)
+_TOKEN_RE = re.compile(
+    r'((?s:/\*.*?\*/))'
+    r'|(^[ \t]*@import[ \t]+"([^"]+)"[ \t]*;.*$)'
+    r'|(^[ \t]*\$([A-Za-z_]\w*)[ \t]*:\s*(.+?);[ \t]*$)'
+    r'|(\b(?i:darken|lighten|alpha)\()'
+    r'|(\$([A-Za-z_]\w*)\b)',
+    re.MULTILINE,
+)
+
+# Text between two @import lines, compiled to a %-template whose %s slots are
+# filled with the references ("$name" or a color call, in order), plus the
+# variables it declares. A file's plan interleaves chunks and import paths.
+_Chunk = Tuple[str, Tuple[str, ...], Dict[str, str]]
+_Plan = List[Union[_Chunk, str]]
+
+# A chunk is also closed at a line break once it spans this many source
+# characters, so tokenizing and rendering work on bounded pieces of text.
+_CHUNK_SIZE = 1 << 16
+
+# resolved path -> ((st_mtime_ns, st_size), plan); a file is read and parsed
+# once per change. The size guards against edits landing within the mtime
+# granularity of the filesystem.
+_SOURCE_CACHE: Dict[Path, Tuple[Tuple[int, int], _Plan]] = {}
+
+
+# The parsers below are memoized: the same few colors and amounts come back
+# for every lighten($primary, ...) call. Callers pass stripped arguments.
+@lru_cache(maxsize=256)
+def _hex_to_int(s: str) -> int:
+    # packed 0xRRGGBB
+    m = _match_hex(s)
+    if m is None:
+        raise ValueError(f"Invalid color: {s}")
+    digits = m.group(1)
+    v = int(digits, 16)
+    if len(digits) == 3:
+        # #abc -> #aabbcc
+        return ((v & 0xF00) << 8 | (v & 0xF0) << 4 | v & 0xF) * 0x11
+    return v
 
 
 def _hex_to_rgb(s: str):
-    s = s.strip()
-    if s.startswith('#'):
-        s = s[1:]
-    if len(s) == 3:
-        s = ''.join(ch * 2 for ch in s)
-    if len(s) != 6:
-        raise ValueError(f"Invalid color: #{s}")
-    r = int(s[0:2], 16)
-    g = int(s[2:4], 16)
-    b = int(s[4:6], 16)
-    return r, g, b
+    v = _hex_to_int(s)
+    return (v >> 16) & 0xFF, (v >> 8) & 0xFF, v & 0xFF
 
 
 def _rgb_to_hex(r: int, g: int, b: int) -> str:
-    return "#{:02X}{:02X}{:02X}".format(
-        max(0, min(255, r)),
-        max(0, min(255, g)),
-        max(0, min(255, b)),
-    )
+    r = 0 if r < 0 else 255 if r > 255 else r
+    g = 0 if g < 0 else 255 if g > 255 else g
+    b = 0 if b < 0 else 255 if b > 255 else b
+    return "#" + _HEX2[r] + _HEX2[g] + _HEX2[b]
 
 
+@lru_cache(maxsize=256)
 def _parse_percent_or_float(s: str) -> float:
-    s = s.strip()
     if s.endswith('%'):
         return float(s[:-1]) / 100.0
     return float(s)
 
 
-def _lighten(hex_color: str, amt: str) -> str:
-    r, g, b = _hex_to_rgb(hex_color)
-    f = _parse_percent_or_float(amt)
-    r = int(r + (255 - r) * f)
-    g = int(g + (255 - g) * f)
-    b = int(b + (255 - b) * f)
+def _mix(rgb: int, f: float, lighten: bool) -> str:
+    # blend a packed 0xRRGGBB color towards white (lighten) or black (darken)
+    r = (rgb >> 16) & 0xFF
+    g = (rgb >> 8) & 0xFF
+    b = rgb & 0xFF
+    if lighten:
+        r = int(r + (255 - r) * f)
+        g = int(g + (255 - g) * f)
+        b = int(b + (255 - b) * f)
+    else:
+        k = 1 - f
+        r = int(r * k)
+        g = int(g * k)
+        b = int(b * k)
     return _rgb_to_hex(r, g, b)
 
 
+def _lighten(hex_color: str, amt: str) -> str:
+    return _mix(_hex_to_int(hex_color), _parse_percent_or_float(amt), True)
+
+
 def _darken(hex_color: str, amt: str) -> str:
-    r, g, b = _hex_to_rgb(hex_color)
-    f = _parse_percent_or_float(amt)
-    r = int(r * (1 - f))
-    g = int(g * (1 - f))
-    b = int(b * (1 - f))
-    return _rgb_to_hex(r, g, b)
+    return _mix(_hex_to_int(hex_color), _parse_percent_or_float(amt), False)
 
 
 def _alpha(hex_color: str, a: str) -> str:
     # Qt rgba(r,g,b,a) support
     r, g, b = _hex_to_rgb(hex_color)
-    a_val = _parse_percent_or_float(a)
-    if 0 <= a_val <= 1:
-        alpha_255 = int(round(a_val * 255))
-    else:
-        # to 50% for exemple
-        alpha_255 = int(round(_parse_percent_or_float(a) * 255))
+    # 0.5 and 50% both parse to 0.5
+    alpha_255 = int(round(_parse_percent_or_float(a) * 255))
     return f"rgba({r}, {g}, {b}, {alpha_255})"
 
 
+_FUNCS: Dict[str, Callable[[str, str], str]] = {
+    'lighten': _lighten,
+    'darken': _darken,
+    'alpha': _alpha,
+}
+
+
 def _apply_functions(text: str) -> str:
-    def repl(m: re.Match):
-        func = m.group(1).lower()
-        color = m.group(2).strip()
-        amt = m.group(3).strip()
-        if func == 'lighten':
-            return _lighten(color, amt)
-        elif func == 'darken':
-            return _darken(color, amt)
-        elif func == 'alpha':
-            return _alpha(color, amt)
-        return m.group(0)
-
-    # Repeat as long as there are functions to resolve (e.g., nested ones)
-    last = None
-    cur = text
-    for _ in range(10):  # avoid infinite loop
-        cur2 = _FUNC_RE.sub(repl, cur)
-        if cur2 == cur:
-            break
-        cur = cur2
-    return cur
+    # Single inside-out walk: a call is evaluated when its closing parenthesis
+    # is reached, so nested calls already have their arguments resolved.
+    if text.find("(") < 0:
+        return text
+    out: List[str] = []
+    stack: List[Tuple[str | None, int]] = []
+    last = 0
+    for m in _CALL_RE.finditer(text):
+        out.append(text[last:m.start()])
+        last = m.end()
+        if m.group(0) != ")":
+            out.append(m.group(0))
+            stack.append((m.group(1), len(out)))
+            continue
+        if stack:
+            func, mark = stack.pop()
+            if func is not None:
+                color, sep, amt = "".join(out[mark:]).partition(",")
+                if sep:
+                    del out[mark - 1:]  # the arguments and "func("
+                    out.append(_FUNCS[func.lower()](color.strip(), amt.strip()))
+                    continue
+        out.append(")")
+    out.append(text[last:])
+    return "".join(out)
+
+
+def _call_end(text: str, pos: int) -> int:
+    # index just past the parenthesis closing the call opened before `pos`, or -1
+    depth = 1
+    while depth:
+        close = text.find(")", pos)
+        if close < 0:
+            return -1
+        opening = text.find("(", pos, close)
+        comment = text.find("/*", pos, close if opening < 0 else opening)
+        if comment >= 0:
+            # parentheses inside a comment do not count
+            pos = text.find("*/", comment + 2)
+            if pos < 0:
+                return -1
+            pos += 2
+        elif opening < 0:
+            depth -= 1
+            pos = close + 1
+        else:
+            depth += 1
+            pos = opening + 1
+    return pos
+
+
+def clear_cache() -> None:
+    """Forget the source files parsed by previous compilations."""
+    _SOURCE_CACHE.clear()
+
+
+def _read_source(source: Path) -> str:
+    # one os.read of the whole file, no buffered/text IO layers
+    fd = os.open(source, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+    try:
+        data = os.read(fd, os.fstat(fd).st_size)
+    finally:
+        os.close(fd)
+    text = data.decode('utf-8')
+    if "\r" in text:
+        # what the universal-newlines text layer used to do
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return text
 
 
-def _collect(source: Path, visited: Set[Path]) -> str:
-    source = source.resolve()
-    if source in visited:
-        raise RuntimeError(f"Import cycle detected with: {source}")
-    visited.add(source)
+def _load(source: Path) -> _Plan:
+    st = source.stat()
+    key = (st.st_mtime_ns, st.st_size)
+    hit = _SOURCE_CACHE.get(source)
+    if hit is not None and hit[0] == key:
+        return hit[1]
+    plan = _tokenize(_read_source(source))
+    _SOURCE_CACHE[source] = (key, plan)
+    return plan
 
-    text = source.read_text(encoding='utf-8')
 
+def _collect(root: Path) -> List[_Chunk]:
     # Résoudre les imports *avant* d'extraire les variables, pour permettre
     # d'overrider des variables après import.
-    def import_repl(m: re.Match):
-        rel = m.group(1)
-        child = (source.parent / rel).resolve()
+    # Depth-first walk with an explicit stack of open files, flattening their
+    # plans into the document's chunks.
+    root = root.resolve()
+    stack = [[root, _load(root), 0]]
+    chain: Set[Path] = {root}
+    chunks: List[_Chunk] = []
+    while stack:
+        frame = stack[-1]
+        source, plan, i = frame
+        if i == len(plan):
+            stack.pop()
+            chain.discard(source)
+            continue
+        frame[2] = i + 1
+        item = plan[i]
+        if not isinstance(item, str):
+            chunks.append(item)
+            continue
+        child = (source.parent / item).resolve()
         if not child.exists():
             raise FileNotFoundError(f"@import not found: {child}")
-        return _collect(child, visited)
+        if child in chain:
+            raise RuntimeError(f"Import cycle detected with: {child}")
+        chain.add(child)
+        stack.append([child, _load(child), 0])
+    return chunks
+
+
+def _resolve_vars(vars_: Dict[str, str]) -> Dict[str, str]:
+    # Substitute every variable exactly once, in dependency order (Kahn).
+    # References into a cycle are left unexpanded.
+    deps: Dict[str, Set[str]] = {}
+    users: Dict[str, List[str]] = {}
+    pending: Dict[str, int] = {}
+    for k, v in vars_.items():
+        ds = {d for d in _VAR_USE_RE.findall(v) if d in vars_} if v.find("$") >= 0 else set()
+        deps[k] = ds
+        pending[k] = len(ds)
+        for d in ds:
+            users.setdefault(d, []).append(k)
 
-    text = _IMPORT_RE.sub(import_repl, text)
-    return text
+    resolved = dict(vars_)
 
+    def use_repl(m: re.Match):
+        return resolved.get(m.group(1), m.group(0))
 
-def _extract_vars(text: str) -> Dict[str, str]:
-    vars_: Dict[str, str] = {}
-    for m in _VAR_DEF_RE.finditer(text):
-        name = m.group(1)
-        val = m.group(2).strip()
-        vars_[name] = val
-    return vars_
+    ready = [k for k, n in pending.items() if n == 0]
+    while ready:
+        k = ready.pop()
+        if deps[k]:
+            resolved[k] = _sub_vars(use_repl, resolved[k])
+        for u in users.get(k, ()):
+            pending[u] -= 1
+            if pending[u] == 0:
+                ready.append(u)
 
+    stuck = {k for k, n in pending.items() if n}
+    if stuck:
+        # still expand whatever does not lead back into a cycle
+        def known_repl(m: re.Match):
+            name = m.group(1)
+            return m.group(0) if name in stuck else resolved.get(name, m.group(0))
 
-def _remove_comments(text: str) -> str:
-    return re.sub(r"/\*.*?\*/", "", text, flags=re.DOTALL)
+        for k in stuck:
+            resolved[k] = _sub_vars(known_repl, resolved[k])
+    return resolved
 
 
-def _remove_var_declarations(text: str) -> str:
-    # remove lines that are variable declarations
-    text = _VAR_DEF_RE.sub('', text)
-
-    # remove leftover comment lines that only contain comments around variables
-    lines = []
-    skip_next = False
-    for line in text.splitlines():
-        stripped = line.strip()
-        if not stripped:
-            continue
-        # skip comments that look like "/* --- Variables --- */"
-        if stripped.startswith("/*") and "Variables" in stripped and stripped.endswith("*/"):
-            continue
-        lines.append(line)
-    return "\n".join(lines)
+def _template(pieces: List[str]) -> str:
+    # drop the lines left empty once comments and declarations are gone
+    return "\n".join(filter(str.strip, "".join(pieces).split("\n")))
 
 
-def _expand_vars(text: str, vars_: Dict[str, str]) -> str:
-    # multi-pass resolution (if one variable uses another variable)
-    resolved = dict(vars_)
-    for _ in range(10):  # max depth
-        changed = False
-        for k, v in list(resolved.items()):
-            new_v = _VAR_USE_RE.sub(lambda m: resolved.get(m.group(1), m.group(0)), v)
-            if new_v != v:
-                resolved[k] = new_v
-                changed = True
-        if not changed:
-            break
+def _tokenize(text: str) -> _Plan:
+    """
+    Single walk over one source file: comments and variable declarations
+    are dropped (declarations are recorded), everything else becomes a
+    %-template of the literal text with a %s slot per variable / color
+    function reference. Each @import line closes the current chunk and is
+    kept as its relative path; long runs of text are cut at line breaks
+    into chunks of about _CHUNK_SIZE characters.
+    """
+    plan: _Plan = []
+    pieces: List[str] = []
+    refs: List[str] = []
+    vars_: Dict[str, str] = {}
+    append = pieces.append
+    add_ref = refs.append
+    last = 0
+    limit = _CHUNK_SIZE
+    # finditer keeps the scan inside the regex engine; matches falling inside
+    # a color call that was already taken whole are skipped
+    for m in _TOKEN_RE.finditer(text):
+        start = m.start()
+        if start < last:
+            continue
+        if start > limit:
+            # cut in the literal text only: render joins chunks with "\n"
+            nl = text.rfind("\n", last, start)
+            if nl >= 0:
+                append(text[last:nl].replace("%", "%%"))
+                plan.append((_template(pieces), tuple(refs), vars_))
+                pieces = []
+                refs = []
+                vars_ = {}
+                append = pieces.append
+                add_ref = refs.append
+                last = nl + 1
+                limit = last + _CHUNK_SIZE
+        end = m.end()
+        kind = m.lastindex
+        if kind == 7:
+            # take the whole call, nested calls included
+            end = _call_end(text, end)
+            if end < 0:
+                continue
+        if start > last:
+            append(text[last:start].replace("%", "%%"))
+        if kind == 8:
+            append("%s")
+            add_ref(text[start:end])
+        elif kind == 7:
+            append("%s")
+            call = text[start:end]
+            if call.find("/*") >= 0:
+                call = _COMMENT_RE.sub("", call)
+            add_ref(call)
+        elif kind == 4:
+            vars_[m.group(5)] = m.group(6).strip()
+        elif kind == 2:
+            plan.append((_template(pieces), tuple(refs), vars_))
+            plan.append(m.group(3))
+            pieces = []
+            refs = []
+            vars_ = {}
+            append = pieces.append
+            add_ref = refs.append
+            limit = end + _CHUNK_SIZE
+        last = end
+    append(text[last:].replace("%", "%%"))
+    plan.append((_template(pieces), tuple(refs), vars_))
+    return plan
+
+
+def _render(chunks: List[_Chunk], vars_: Dict[str, str], out: Callable[[str], None]) -> None:
+    resolved = _resolve_vars(vars_)
+    values: Dict[str, str] = {}
+
+    def lookup(name: str) -> str:
+        val = values.get(name)
+        if val is None:
+            # variable values may themselves hold color functions
+            val = _apply_functions(resolved[name]) if name in resolved else "$" + name
+            values[name] = val
+        return val
 
     def use_repl(m: re.Match):
-        key = m.group(1)
-        return resolved.get(key, m.group(0))  # laisse tel quel si inconnue
-
-    return _VAR_USE_RE.sub(use_repl, text)
-
-
-def compile_qss(input_path: str | Path) -> str:
+        return lookup(m.group(1))
+
+    def expand(ref: str) -> str:
+        if ref[0] == "$":
+            return lookup(ref[1:])
+        if ref.find("$") >= 0:
+            ref = _sub_vars(use_repl, ref)
+        return _apply_functions(ref)
+
+    # each distinct reference is evaluated once for the whole document
+    expanded: Dict[str, str] = {}
+    # chunks break at whole @import lines, so newline-joining them keeps the
+    # line structure
+    sep = ""
+    for template, refs, _ in chunks:
+        if not template:
+            continue
+        for ref in dict.fromkeys(refs):
+            if ref not in expanded:
+                expanded[ref] = expand(ref)
+        out(sep)
+        out(template % tuple(map(expanded.__getitem__, refs)))
+        sep = "\n"
+
+
+@overload
+def compile_qss(input_path: str | Path, out: None = None) -> str: ...
+@overload
+def compile_qss(input_path: str | Path, out: Callable[[str], None]) -> None: ...
+def compile_qss(input_path: str | Path, out: Optional[Callable[[str], None]] = None) -> str | None:
     """
     Compiles a .qsspp file into pure QSS:
     - @import
     - $var variables
     - Color functions (lighten, darken, alpha)
+
+    Returns the QSS text, or, when `out` is given (e.g. a file's `write`),
+    streams it to `out` piece by piece and returns None.
+
+    Each source file is parsed once per modification and kept as compiled
+    templates, so recompiling after a variable edit only re-parses the
+    edited file.
     """
     root = Path(input_path).resolve()
-    raw = _collect(root, set())
-    vars_ = _extract_vars(raw)
-    without_defs = _remove_var_declarations(raw)
-    without_defs = _remove_comments(without_defs)
-    expanded = _expand_vars(without_defs, vars_)
-    final = _apply_functions(expanded)
-    return final
+    chunks = _collect(root)
+    vars_: Dict[str, str] = {}
+    for _, _, defs in chunks:
+        vars_.update(defs)
+    if out is not None:
+        _render(chunks, vars_, out)
+        return None
+    pieces: List[str] = []
+    _render(chunks, vars_, pieces.append)
+    return "".join(pieces)
+
+
+def compile_to_file(input_path: str | Path, output_path: str | Path) -> None:
+    """
+    Compiles a .qsspp file like compile_qss and writes the QSS to
+    `output_path`:
+    - streamed into a temporary file next to the output, renamed over it on success
+    - a failed compile leaves an existing output, and the directory tree, as they were
+    - symlinks are written through and an existing output keeps its mode
+    """
+    # resolved first: renaming over a symlink would replace the link itself
+    dst = Path(output_path).resolve()
+    # missing parent directories, deepest first, removed again on failure
+    missing: List[Path] = []
+    parent = dst.parent
+    while not parent.exists():
+        missing.append(parent)
+        parent = parent.parent
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        # stream into a uniquely named sibling temp file, then rename it over
+        # dst; concurrent writers into the same directory never share a temp
+        # file. O_EXCL guards the name; 0o666 lets the kernel apply the umask,
+        # as open() would.
+        while True:
+            tmp = dst.with_name(f"{dst.name}.{os.urandom(4).hex()}.tmp")
+            try:
+                fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+            except FileExistsError:
+                continue
+            break
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8", buffering=65536) as f:
+                compile_qss(input_path, out=f.write)
+            if dst.exists():
+                # an existing output keeps its permissions
+                shutil.copymode(dst, tmp)
+            os.replace(tmp, dst)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+    except BaseException:
+        for d in missing:
+            try:
+                d.rmdir()
+            except OSError:
+                break
+        raise
 
 
 if __name__ == "__main__":
@@ -196,8 +482,8 @@ if __name__ == "__main__":
     p.add_argument("-o", "--output", help="Output .qss file (otherwise stdout)")
     args = p.parse_args()
 
-    css = compile_qss(args.input)
     if args.output:
-        Path(args.output).write_text(css, encoding='utf-8')
+        # never truncate an existing output before the compile has succeeded
+        compile_to_file(args.input, args.output)
     else:
-        sys.stdout.write(css)
+        compile_qss(args.input, out=sys.stdout.write)
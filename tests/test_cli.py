@@ -0,0 +1,150 @@
+# SPDX-FileCopyrightText: 2025 SCHARTIER Isaac
+# SPDX-License-Identifier: MIT
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from qsspp.cli import compile_one, main, resolve_inputs
+from qsspp.core import clear_cache
+
+
+class CompileOneTest(unittest.TestCase):
+    def setUp(self):
+        clear_cache()
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        self.dir = Path(self._tmp.name)
+
+    def _compile_one(self, src, dst):
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            return compile_one(src, dst)
+
+    def test_writes_output(self):
+        src = self.dir / "main.qsspp"
+        src.write_text("$c: red;\nQLabel { color: $c; }\n", encoding="utf-8")
+        dst = self.dir / "out" / "main.qss"
+        self.assertTrue(self._compile_one(src, dst))
+        self.assertEqual(dst.read_text(encoding="utf-8"), "QLabel { color: red; }")
+        umask = os.umask(0)
+        os.umask(umask)
+        self.assertEqual(dst.stat().st_mode & 0o777, 0o666 & ~umask)
+
+    def test_writes_through_symlink_and_keeps_mode(self):
+        src = self.dir / "main.qsspp"
+        src.write_text("QLabel { color: red; }\n", encoding="utf-8")
+        real = self.dir / "real.qss"
+        real.write_text("previous", encoding="utf-8")
+        real.chmod(0o600)
+        link = self.dir / "main.qss"
+        link.symlink_to(real)
+        self.assertTrue(self._compile_one(src, link))
+        self.assertTrue(link.is_symlink())
+        self.assertEqual(real.read_text(encoding="utf-8"), "QLabel { color: red; }")
+        self.assertEqual(real.stat().st_mode & 0o777, 0o600)
+
+    def test_failure_keeps_previous_output(self):
+        src = self.dir / "main.qsspp"
+        src.write_text('@import "missing.qsspp";\n', encoding="utf-8")
+        dst = self.dir / "main.qss"
+        dst.write_text("previous", encoding="utf-8")
+        self.assertFalse(self._compile_one(src, dst))
+        self.assertEqual(dst.read_text(encoding="utf-8"), "previous")
+        self.assertEqual(sorted(p.name for p in self.dir.iterdir()), ["main.qss", "main.qsspp"])
+
+    def test_failure_leaves_no_output_directory(self):
+        src = self.dir / "main.qsspp"
+        src.write_text('@import "missing.qsspp";\n', encoding="utf-8")
+        self.assertFalse(self._compile_one(src, self.dir / "out" / "qss" / "main.qss"))
+        self.assertEqual([p.name for p in self.dir.iterdir()], ["main.qsspp"])
+
+
+class ResolveInputsTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(self._tmp.name)
+        for path in ("top.qsspp", "assets/a.qsspp", "assets/notes.txt", "assets/sub/b.qsspp",
+                     "assets/sub/deep/c.qsspp", "other/o.qsspp"):
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            Path(path).write_text("", encoding="utf-8")
+        os.symlink(os.path.join("..", "other"), os.path.join("assets", "link"))
+
+    def _resolve(self, *patterns):
+        stderr = io.StringIO()
+        with contextlib.redirect_stderr(stderr):
+            files = resolve_inputs(list(patterns))
+        return sorted(p.as_posix() for p in files), stderr.getvalue()
+
+    def test_recursive_pattern(self):
+        self.assertEqual(self._resolve("**/*.qsspp")[0], [
+            "assets/a.qsspp", "assets/sub/b.qsspp", "assets/sub/deep/c.qsspp",
+            "other/o.qsspp", "top.qsspp",
+        ])
+
+    def test_recursive_pattern_skips_symlinked_directories(self):
+        self.assertEqual(self._resolve("assets/**/*.qsspp")[0], [
+            "assets/a.qsspp", "assets/sub/b.qsspp", "assets/sub/deep/c.qsspp",
+        ])
+        # a single-level wildcard still matches the link, as Path.glob does
+        self.assertEqual(self._resolve("assets/*/*.qsspp")[0], ["assets/link/o.qsspp", "assets/sub/b.qsspp"])
+
+    def test_directory_pattern(self):
+        self.assertEqual(self._resolve("assets/*.qsspp"), (["assets/a.qsspp"], ""))
+
+    def test_plain_file_path(self):
+        self.assertEqual(self._resolve("assets/sub/b.qsspp"), (["assets/sub/b.qsspp"], ""))
+
+    def test_absolute_pattern(self):
+        base = Path(self._tmp.name).resolve()
+        files, _ = self._resolve(str(base / "assets" / "sub" / "**" / "*.qsspp"))
+        self.assertEqual(files, [(base / "assets/sub/b.qsspp").as_posix(),
+                                 (base / "assets/sub/deep/c.qsspp").as_posix()])
+
+    def test_parent_component_after_wildcard(self):
+        self.assertEqual(self._resolve("assets/*/../a.qsspp")[0], ["assets/sub/../a.qsspp"])
+
+    def test_warns_when_only_other_files_match(self):
+        files, stderr = self._resolve("assets/*.txt", "assets/*.qsspp", "assets/*.qsspp")
+        self.assertEqual(files, ["assets/a.qsspp"])
+        self.assertIn("[WARN] no files matched: assets/*.txt", stderr)
+
+
+class MainTest(unittest.TestCase):
+    def setUp(self):
+        clear_cache()
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        self.dir = Path(self._tmp.name)
+
+    def _main(self, *argv):
+        with mock.patch("sys.argv", ["ss-qssppc", *argv]), \
+                contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            return main()
+
+    def test_pool_compiles_shared_destinations_in_input_order(self):
+        (self.dir / "a").mkdir()
+        (self.dir / "b").mkdir()
+        for i in range(8):
+            (self.dir / "a" / f"f{i}.qsspp").write_text(f"QLabel {{ color: a{i}; }}\n", encoding="utf-8")
+        # the earlier input for out/f0.qss is the slow one: in a pool it would
+        # finish last and overwrite the later input's output
+        (self.dir / "b" / "f0.qsspp").write_text(
+            "$c: lighten(#000000, 10%);\n" + "QLabel { color: $c; }\n" * 20000, encoding="utf-8")
+        out = self.dir / "out"
+        # several workers even on a single-core machine
+        with mock.patch("os.cpu_count", return_value=4):
+            status = self._main(str(self.dir / "b" / "f0.qsspp"), str(self.dir / "a" / "*.qsspp"),
+                                "-o", str(out))
+        self.assertEqual(status, 0)
+        self.assertEqual(sorted(p.name for p in out.iterdir()), [f"f{i}.qss" for i in range(8)])
+        for i in range(8):
+            self.assertEqual((out / f"f{i}.qss").read_text(encoding="utf-8"),
+                             f"QLabel {{ color: a{i}; }}")
+
+if __name__ == "__main__":
+    unittest.main()
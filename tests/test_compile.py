@@ -0,0 +1,64 @@
+# SPDX-FileCopyrightText: 2025 SCHARTIER Isaac
+# SPDX-License-Identifier: MIT
+"""
+Fixture-based regression checks for ``compile_qss``.
+
+Each directory under ``fixtures/`` holds a ``main.qsspp`` entry point and the
+``expected.qss`` it must compile to. Expected files were checked against the
+original regex-chain compiler (blank lines aside) wherever it could handle
+the input.
+"""
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+from qsspp.core import clear_cache, compile_qss
+
+FIXTURES = Path(__file__).parent / "fixtures"
+CASES = sorted(p.name for p in FIXTURES.iterdir() if (p / "expected.qss").is_file())
+
+
+class CompileFixturesTest(unittest.TestCase):
+    def setUp(self):
+        clear_cache()
+
+    def test_fixtures(self):
+        for case in CASES:
+            with self.subTest(case=case):
+                expected = (FIXTURES / case / "expected.qss").read_text(encoding="utf-8")
+                self.assertEqual(compile_qss(FIXTURES / case / "main.qsspp"), expected)
+
+    def test_streamed_output_matches(self):
+        for case in CASES:
+            with self.subTest(case=case):
+                pieces = []
+                self.assertIsNone(compile_qss(FIXTURES / case / "main.qsspp", out=pieces.append))
+                self.assertEqual("".join(pieces), compile_qss(FIXTURES / case / "main.qsspp"))
+
+    def test_import_cycle(self):
+        with self.assertRaisesRegex(RuntimeError, "Import cycle"):
+            compile_qss(FIXTURES / "errors" / "a.qsspp")
+
+    def test_missing_import(self):
+        with self.assertRaisesRegex(FileNotFoundError, "@import not found"):
+            compile_qss(FIXTURES / "errors" / "missing.qsspp")
+
+
+class SourceCacheTest(unittest.TestCase):
+    def setUp(self):
+        clear_cache()
+
+    def test_same_mtime_different_size_is_reparsed(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "main.qsspp"
+            path.write_text("QLabel { color: red; }\n", encoding="utf-8")
+            stamp = path.stat().st_mtime_ns
+            self.assertEqual(compile_qss(path), "QLabel { color: red; }")
+            path.write_text("QLabel { color: blue; }\n", encoding="utf-8")
+            os.utime(path, ns=(stamp, stamp))
+            self.assertEqual(compile_qss(path), "QLabel { color: blue; }")
+
+
+if __name__ == "__main__":
+    unittest.main()